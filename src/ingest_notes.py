@@ -0,0 +1,402 @@
+"""
+Note ingestion CLI: handwritten note images -> knowledge base markdown.
+
+Preprocesses each image (see preprocess.py), OCRs it with GPT-4o
+(see ocr_vision.py), and writes a JSON result plus a markdown file
+with YAML frontmatter into the knowledge base layout described in
+TECHNICAL_SPECS.md.
+"""
+
+import argparse
+import asyncio
+import fnmatch
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import orjson
+
+# OpenCV and the OpenAI SDK (via preprocess/ocr_vision) cost hundreds
+# of milliseconds to import, dominating --help and trivial runs, so
+# they are imported lazily where first needed.
+
+# One pipeline per worker process, built lazily on first task so the
+# OpenAI client and preprocessor are never pickled across processes.
+_WORKER_PIPELINE = None
+
+
+def _worker(image_path: str, custom_prompt: str, cfg: dict) -> dict:
+    """Process one image inside a pool worker.
+
+    Top-level (picklable) entry point for the executor. ``cfg`` carries
+    only paths and flags; heavy objects are constructed here.
+    """
+    global _WORKER_PIPELINE
+    if _WORKER_PIPELINE is None:
+        _WORKER_PIPELINE = NoteIngestionPipeline(**cfg)
+    return _WORKER_PIPELINE.process_single_image(Path(image_path), custom_prompt)
+
+
+class NoteIngestionPipeline:
+    """End-to-end ingestion of note images into the knowledge base."""
+
+    def __init__(
+        self,
+        output_dir: str = "data/notes",
+        preprocess: bool = True,
+        save_processed_images: bool = False,
+    ):
+        from ocr_vision import VisionOCR
+        from preprocess import ImagePreprocessor
+
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.preprocess = preprocess
+        self.save_processed = save_processed_images
+        self.processed_dir = self.output_dir / "processed"
+        if self.save_processed:
+            self.processed_dir.mkdir(parents=True, exist_ok=True)
+        self.preprocessor = ImagePreprocessor() if preprocess else None
+        self.ocr = VisionOCR()
+
+    def close(self) -> None:
+        """Release the OCR client's pooled connections."""
+        self.ocr.close()
+
+    def _pool_config(self) -> dict:
+        """Kwargs to rebuild an equivalent pipeline in a worker process."""
+        return {
+            "output_dir": str(self.output_dir),
+            "preprocess": self.preprocess,
+            "save_processed_images": self.save_processed,
+        }
+
+    def process_single_image(self, image_path: Path, custom_prompt: str = None) -> dict:
+        """Preprocess + OCR one image and write its JSON and markdown outputs.
+
+        Args:
+            image_path: Path to the source note image.
+            custom_prompt: Optional OCR prompt override.
+
+        Returns:
+            The OCR result dict (see VisionOCR.extract_text_and_analyze).
+        """
+        if self.preprocess:
+            try:
+                processed_image, decoded_scale = self.preprocessor.process_image(
+                    image_path
+                )
+            except Exception as exc:  # noqa: BLE001 - surface per-image failures
+                return {
+                    "success": False,
+                    "error": str(exc),
+                    "source_image": str(image_path),
+                }
+            if self.save_processed:
+                self.preprocessor.save_processed_image(
+                    processed_image, self.processed_dir / image_path.name
+                )
+            result = self.ocr.extract_from_array(
+                processed_image, custom_prompt, source=str(image_path)
+            )
+            if result.get("success"):
+                result["metadata"]["decoded_scale"] = decoded_scale
+        else:
+            result = self.ocr.extract_text_and_analyze(image_path, custom_prompt)
+
+        self._write_outputs(result, image_path)
+        return result
+
+    def _write_outputs(self, result: dict, image_path: Path) -> None:
+        """Write the JSON result and knowledge-base markdown for one image."""
+        if not result.get("success"):
+            return
+        stem = image_path.stem
+        output_json = self.output_dir / f"{stem}.json"
+        output_json.write_bytes(
+            orjson.dumps(
+                result, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY
+            )
+        )
+        output_md = self.output_dir / f"{stem}.md"
+        output_md.write_text(
+            self._create_markdown(result, image_path), encoding="utf-8"
+        )
+
+    def process_directory(
+        self,
+        directory: Path,
+        pattern: str = "*.jpg",
+        custom_prompt: str = None,
+        workers: int = None,
+        batch_pages: int = None,
+    ) -> list:
+        """Process every matching image in a directory in parallel.
+
+        Preprocessing is CPU-bound OpenCV work, so images are fanned out
+        over a process pool; with preprocessing disabled the work is pure
+        network I/O and the batch runs as overlapped async API calls
+        instead. With ``batch_pages`` set, consecutive pages are stitched
+        into one tall image per vision call (see VisionOCR.extract_batch),
+        which bypasses preprocessing since the source files are stitched
+        directly.
+
+        Args:
+            directory: Directory containing note images.
+            pattern: Glob pattern for image files.
+            custom_prompt: Optional OCR prompt override.
+            workers: Pool size / API concurrency (defaults to the CPU
+                count for preprocessing, 8 for OCR-only).
+            batch_pages: Pages stitched per vision call, if set.
+
+        Returns:
+            List of per-image result dicts.
+        """
+        # os.scandir avoids the per-entry stat and Path construction
+        # Path.glob does for every file in large note directories. The
+        # dotfile check preserves Path.glob semantics: fnmatch would
+        # happily match hidden files like macOS ._*.jpg sidecars.
+        names = [
+            entry.name
+            for entry in os.scandir(directory)
+            if entry.is_file()
+            and not entry.name.startswith(".")
+            and fnmatch.fnmatch(entry.name, pattern)
+        ]
+        names.sort()
+        image_paths = [Path(directory) / name for name in names]
+        if not image_paths:
+            print(f"No images matching {pattern!r} in {directory}")
+            return []
+
+        if batch_pages:
+            print(
+                f"Processing {len(image_paths)} images in stitched "
+                f"batches of {batch_pages}..."
+            )
+            results = self.ocr.extract_batch(
+                image_paths, custom_prompt, batch_size=batch_pages
+            )
+            for result, path in zip(results, image_paths):
+                self._write_outputs(result, path)
+        elif self.preprocess:
+            pool_workers = workers or os.cpu_count() or 1
+            if pool_workers == 1:
+                results = self._process_directory_pipelined(
+                    image_paths, custom_prompt
+                )
+            else:
+                results = self._process_directory_pool(
+                    image_paths, custom_prompt, pool_workers
+                )
+        else:
+            results = asyncio.run(
+                self.ocr.batch_process_async(
+                    image_paths, custom_prompt, concurrency=workers or 8
+                )
+            )
+            for result, path in zip(results, image_paths):
+                self._write_outputs(result, path)
+
+        # Worker processes keep their own OCR cost state; aggregate from
+        # per-result metadata instead.
+        total_cost = sum(
+            r.get("metadata", {}).get("cost", 0.0) for r in results
+        )
+        succeeded = sum(1 for r in results if r.get("success"))
+        summary = {
+            "total_images": len(image_paths),
+            "succeeded": succeeded,
+            "failed": len(image_paths) - succeeded,
+            "total_cost": total_cost,
+        }
+        summary_path = self.output_dir / "_summary.json"
+        summary_path.write_bytes(
+            orjson.dumps(summary, option=orjson.OPT_INDENT_2)
+        )
+        print(f"Done: {succeeded}/{len(image_paths)} ok, est. cost ${total_cost:.4f}")
+        return results
+
+    def _process_directory_pool(
+        self, image_paths: list, custom_prompt: str, workers: int
+    ) -> list:
+        """Fan images out over a process pool (preprocessing enabled)."""
+        cfg = self._pool_config()
+        print(f"Processing {len(image_paths)} images with {workers} workers...")
+        results = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_worker, str(path), custom_prompt, cfg): path
+                for path in image_paths
+            }
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    result = future.result()
+                except Exception as exc:  # noqa: BLE001 - keep the batch going
+                    result = {
+                        "success": False,
+                        "error": str(exc),
+                        "source_image": str(path),
+                    }
+                results.append(result)
+                status = "ok" if result.get("success") else "FAILED"
+                print(f"  [{len(results)}/{len(image_paths)}] {path.name}: {status}")
+        return results
+
+    def _process_directory_pipelined(self, image_paths: list, custom_prompt: str) -> list:
+        """Overlap preprocessing with in-flight OCR (single worker).
+
+        A producer thread preprocesses image N+1 while the main thread
+        waits on the OCR call for image N. OpenCV work and network I/O
+        both release the GIL, so the two stages genuinely overlap and
+        preprocessing latency mostly hides behind the API round-trip.
+        """
+        work = queue.Queue(maxsize=2)
+
+        def _produce():
+            for path in image_paths:
+                try:
+                    processed, decoded_scale = self.preprocessor.process_image(path)
+                    work.put((path, processed, decoded_scale, None))
+                except Exception as exc:  # noqa: BLE001 - keep the batch going
+                    work.put((path, None, None, str(exc)))
+            work.put(None)
+
+        producer = threading.Thread(target=_produce, daemon=True)
+        producer.start()
+
+        print(f"Processing {len(image_paths)} images (pipelined)...")
+        results = []
+        while True:
+            item = work.get()
+            if item is None:
+                break
+            path, processed_image, decoded_scale, error = item
+            if error is not None:
+                result = {
+                    "success": False,
+                    "error": error,
+                    "source_image": str(path),
+                }
+            else:
+                if self.save_processed:
+                    self.preprocessor.save_processed_image(
+                        processed_image, self.processed_dir / path.name
+                    )
+                result = self.ocr.extract_from_array(
+                    processed_image, custom_prompt, source=str(path)
+                )
+                if result.get("success"):
+                    result["metadata"]["decoded_scale"] = decoded_scale
+                self._write_outputs(result, path)
+            results.append(result)
+            status = "ok" if result.get("success") else "FAILED"
+            print(f"  [{len(results)}/{len(image_paths)}] {path.name}: {status}")
+        producer.join()
+        return results
+
+    def _create_markdown(self, result: dict, image_path: Path) -> str:
+        """Render an OCR result as markdown with YAML frontmatter."""
+        import yaml
+
+        try:
+            from yaml import CSafeDumper as _YamlDumper
+        except ImportError:  # libyaml bindings not available
+            from yaml import SafeDumper as _YamlDumper
+
+        frontmatter = {
+            "source": image_path.name,
+            "date": result.get("date"),
+            "topics": result.get("topics", []),
+            "tags": result.get("tags", []),
+            "confidence": result.get("confidence"),
+            "ocr_model": result.get("metadata", {}).get("model"),
+        }
+        md_parts = [
+            "---",
+            yaml.dump(
+                frontmatter,
+                Dumper=_YamlDumper,
+                default_flow_style=False,
+                allow_unicode=True,
+            ).strip(),
+            "---",
+            "",
+            f"# {image_path.stem.replace('_', ' ')}",
+            "",
+            result.get("cleaned_text", ""),
+        ]
+        if result.get("summary"):
+            md_parts += ["", "---", "", f"*Summary: {result['summary']}*"]
+        return "\n".join(md_parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ingest handwritten note images into the knowledge base."
+    )
+    parser.add_argument("input", help="Image file or directory of images")
+    parser.add_argument(
+        "--output-dir", default="data/notes", help="Knowledge base output directory"
+    )
+    parser.add_argument(
+        "--pattern", default="*.jpg", help="Glob pattern for directory input"
+    )
+    parser.add_argument(
+        "--no-preprocess", action="store_true", help="Skip OpenCV preprocessing"
+    )
+    parser.add_argument(
+        "--save-processed",
+        action="store_true",
+        help="Keep preprocessed images next to the output",
+    )
+    parser.add_argument(
+        "--prompt",
+        default=None,
+        help="Custom OCR prompt (must ask for a JSON object)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Parallel workers for directory input (default: CPU count)",
+    )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=None,
+        help="Stitch N pages into one vision call (bypasses preprocessing)",
+    )
+    args = parser.parse_args()
+
+    pipeline = NoteIngestionPipeline(
+        output_dir=args.output_dir,
+        preprocess=not args.no_preprocess,
+        save_processed_images=args.save_processed,
+    )
+
+    input_path = Path(args.input)
+    try:
+        if input_path.is_dir():
+            pipeline.process_directory(
+                input_path,
+                pattern=args.pattern,
+                custom_prompt=args.prompt,
+                workers=args.workers,
+                batch_pages=args.batch,
+            )
+        else:
+            result = pipeline.process_single_image(input_path, args.prompt)
+            if result.get("success"):
+                print(f"OK: {input_path.name} (${result['metadata']['cost']:.4f})")
+            else:
+                print(f"FAILED: {input_path.name}: {result.get('error')}")
+    finally:
+        pipeline.close()
+
+
+if __name__ == "__main__":
+    main()
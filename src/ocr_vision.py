@@ -0,0 +1,454 @@
+"""
+Vision-model OCR for handwritten notes.
+
+Sends note images to GPT-4o and asks for a structured transcription
+(raw text, cleaned text, topics, tags, summary) suitable for the
+knowledge base described in TECHNICAL_SPECS.md.
+"""
+
+import asyncio
+import base64
+import json
+import mmap
+import os
+from pathlib import Path
+
+import cv2
+import httpx
+import numpy as np
+from dotenv import load_dotenv
+
+# USD per 1M tokens (gpt-4o, late-2024 pricing).
+INPUT_COST_PER_M = 2.50
+OUTPUT_COST_PER_M = 10.00
+
+# GPT-4o's "high" detail mode works on tiles of a <=2048px image, so
+# anything larger is resolution the model never sees.
+MAX_LONG_EDGE = 2048
+UPLOAD_JPEG_QUALITY = 85
+
+_POOL_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+_POOL_TIMEOUT = httpx.Timeout(60.0)
+
+DEFAULT_PROMPT = """\
+You are transcribing a photo of handwritten notes.
+
+Return a JSON object with exactly these fields:
+- "raw_text": the text exactly as written, including crossed-out words
+- "cleaned_text": the text cleaned up for readability (fix obvious slips,
+  expand abbreviations you are confident about)
+- "topics": list of 1-5 topic strings
+- "tags": list of short lowercase tags
+- "date": the date written on the page in ISO format, or null
+- "summary": 1-2 sentence summary
+- "confidence": your transcription confidence from 0.0 to 1.0
+
+If a region is illegible, mark it as [illegible] in the text fields.
+"""
+
+# Pages stitched into one tall image for batched calls are resized to
+# this common width; the 5px white separator marks page boundaries.
+STITCH_WIDTH = 1024
+STITCH_SEPARATOR_PX = 5
+
+BATCH_PROMPT = """\
+You are transcribing a single tall image containing {page_count} pages of
+handwritten notes stacked vertically, separated by thin white gaps.
+
+Return a JSON object with one field "pages": a list of exactly
+{page_count} objects, one per page from top to bottom. Each object has
+these fields:
+- "raw_text": the text exactly as written, including crossed-out words
+- "cleaned_text": the text cleaned up for readability
+- "topics": list of 1-5 topic strings
+- "tags": list of short lowercase tags
+- "date": the date written on the page in ISO format, or null
+- "summary": 1-2 sentence summary
+- "confidence": your transcription confidence from 0.0 to 1.0
+
+If a region is illegible, mark it as [illegible] in the text fields.
+"""
+
+
+class VisionOCR:
+    """GPT-4o-based OCR with per-call cost accounting."""
+
+    def __init__(self, api_key: str = None, model: str = "gpt-4o"):
+        # Deferred: the SDK import alone is a noticeable chunk of CLI
+        # startup and is only needed once a client is actually built.
+        from openai import OpenAI
+
+        load_dotenv()
+        self._api_key = api_key or os.getenv("OPENAI_API_KEY")
+        # Explicit pool so repeated calls multiplex over a few
+        # kept-alive HTTP/2 connections instead of paying a TLS
+        # handshake per request. The per-image entry points use this
+        # sync client: an AsyncClient's keep-alive connections bind to
+        # the event loop of their first request, so sharing one across
+        # repeated asyncio.run calls breaks with "Event loop is closed".
+        self._http = httpx.Client(
+            http2=True, limits=_POOL_LIMITS, timeout=_POOL_TIMEOUT
+        )
+        self.client = OpenAI(api_key=self._api_key, http_client=self._http)
+        self.model = model
+        self.total_cost = 0.0
+
+    def close(self) -> None:
+        """Release the pooled connections; the client is unusable after."""
+        self._http.close()
+
+    def encode_array(self, image) -> str:
+        """Encode an in-memory BGR array as a base64 data URL.
+
+        Downscales to the model's effective resolution and compresses
+        as JPEG in memory: larger uploads are resolution and tokens the
+        model would discard anyway. b64encode consumes the encode buffer
+        directly (no tobytes copy), the URL is assembled in bytes, and
+        the single decode is ascii — base64 output is pure ASCII, and
+        this avoids re-copying a multi-MB payload through an f-string.
+        """
+        h, w = image.shape[:2]
+        scale = min(1.0, MAX_LONG_EDGE / max(h, w))
+        if scale < 1.0:
+            image = cv2.resize(
+                image, (int(w * scale), int(h * scale)),
+                interpolation=cv2.INTER_AREA,
+            )
+        ok, buf = cv2.imencode(
+            ".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, UPLOAD_JPEG_QUALITY]
+        )
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+        return (b"data:image/jpeg;base64," + base64.b64encode(buf)).decode("ascii")
+
+    def encode_image(self, image_path: Path) -> str:
+        """Encode an image file as a base64 data URL for the vision API.
+
+        JPEGs already within the resolution budget skip the decode and
+        re-encode entirely: PIL reads just the header for dimensions,
+        and base64 consumes an mmap of the file, so the payload never
+        takes a full-size heap copy (page cache backs the read).
+        """
+        if image_path.suffix.lower() in (".jpg", ".jpeg"):
+            try:
+                from PIL import Image
+
+                with Image.open(image_path) as im:
+                    w, h = im.size
+                if max(w, h) <= MAX_LONG_EDGE:
+                    with open(image_path, "rb") as f, mmap.mmap(
+                        f.fileno(), 0, access=mmap.ACCESS_READ
+                    ) as mm:
+                        return (
+                            b"data:image/jpeg;base64," + base64.b64encode(mm)
+                        ).decode("ascii")
+            except Exception:  # noqa: BLE001 - fall back to decode/re-encode
+                pass
+
+        image = cv2.imread(str(image_path))
+        if image is None:
+            raise ValueError(f"Could not read image: {image_path}")
+        return self.encode_array(image)
+
+    def _request_kwargs(self, prompt: str, data_url: str) -> dict:
+        """Chat-completion arguments shared by the sync and async paths."""
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": data_url,
+                                "detail": "high",
+                            },
+                        },
+                    ],
+                }
+            ],
+            "max_tokens": 4096,
+            # JSON mode: the server guarantees a valid JSON object, so
+            # no fence-stripping heuristics are needed. Requires the
+            # prompt to mention JSON, which DEFAULT_PROMPT does (custom
+            # prompts must too).
+            "response_format": {"type": "json_object"},
+        }
+
+    def _parse_response(self, response, source: str) -> dict:
+        """Turn an API response into a result dict with cost metadata.
+
+        Does not touch ``self.total_cost``; callers accumulate cost from
+        the returned metadata so concurrent tasks need no locking.
+        """
+        content = response.choices[0].message.content
+        result = json.loads(content)
+
+        usage = response.usage
+        call_cost = (
+            usage.prompt_tokens * INPUT_COST_PER_M
+            + usage.completion_tokens * OUTPUT_COST_PER_M
+        ) / 1_000_000
+
+        result["success"] = True
+        result["metadata"] = {
+            "model": self.model,
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "cost": call_cost,
+            "source_image": source,
+        }
+        return result
+
+    def _extract_from_data_url(
+        self, data_url: str, custom_prompt: str, source: str
+    ) -> dict:
+        """Run the vision call on an already-encoded image (sync client).
+
+        Args:
+            data_url: Base64 JPEG data URL for the request body.
+            custom_prompt: Optional prompt overriding DEFAULT_PROMPT.
+            source: Source identifier recorded in the result metadata.
+
+        Returns:
+            Dict with the transcription fields plus a "metadata" block
+            (model, token counts, call cost, source image). On failure,
+            a dict with "success": False and an "error" message.
+        """
+        prompt = custom_prompt or DEFAULT_PROMPT
+        try:
+            response = self.client.chat.completions.create(
+                **self._request_kwargs(prompt, data_url)
+            )
+            return self._parse_response(response, source)
+        except Exception as exc:  # noqa: BLE001 - surface per-image failures
+            return {
+                "success": False,
+                "error": str(exc),
+                "source_image": source,
+            }
+
+    async def _extract_async(
+        self, client, image_path: Path, custom_prompt: str = None
+    ) -> dict:
+        """OCR a single image file via a loop-scoped async client.
+
+        ``client`` is the AsyncOpenAI instance owned by the surrounding
+        batch_process_async run; it must live on the current event loop.
+        """
+        source = str(image_path)
+        try:
+            data_url = self.encode_image(image_path)
+        except Exception as exc:  # noqa: BLE001 - surface per-image failures
+            return {"success": False, "error": str(exc), "source_image": source}
+
+        prompt = custom_prompt or DEFAULT_PROMPT
+        try:
+            response = await client.chat.completions.create(
+                **self._request_kwargs(prompt, data_url)
+            )
+            return self._parse_response(response, source)
+        except Exception as exc:  # noqa: BLE001 - surface per-image failures
+            return {"success": False, "error": str(exc), "source_image": source}
+
+    def extract_text_and_analyze(self, image_path: Path, custom_prompt: str = None) -> dict:
+        """OCR a single image file and analyze its content."""
+        try:
+            data_url = self.encode_image(image_path)
+        except Exception as exc:  # noqa: BLE001 - surface per-image failures
+            return {
+                "success": False,
+                "error": str(exc),
+                "source_image": str(image_path),
+            }
+        result = self._extract_from_data_url(
+            data_url, custom_prompt, str(image_path)
+        )
+        self.total_cost += result.get("metadata", {}).get("cost", 0.0)
+        return result
+
+    def extract_from_array(
+        self, image, custom_prompt: str = None, source: str = "<array>"
+    ) -> dict:
+        """OCR an in-memory BGR array without touching disk.
+
+        Lets preprocessed images go straight to the API instead of
+        round-tripping through a temp file (two JPEG encode/decode
+        cycles plus disk I/O per image).
+        """
+        try:
+            data_url = self.encode_array(image)
+        except Exception as exc:  # noqa: BLE001 - surface per-image failures
+            return {"success": False, "error": str(exc), "source_image": source}
+        result = self._extract_from_data_url(data_url, custom_prompt, source)
+        self.total_cost += result.get("metadata", {}).get("cost", 0.0)
+        return result
+
+    async def batch_process_async(
+        self,
+        image_paths: list,
+        custom_prompt: str = None,
+        concurrency: int = 8,
+    ) -> list:
+        """OCR a list of images with bounded concurrent API calls.
+
+        GPT-4o vision calls take seconds each, so keeping ``concurrency``
+        requests in flight collapses batch wall-clock roughly by that
+        factor.
+
+        Args:
+            image_paths: Paths to the note images.
+            custom_prompt: Optional prompt overriding DEFAULT_PROMPT.
+            concurrency: Maximum in-flight API requests.
+
+        Returns:
+            List of per-image result dicts, in input order.
+        """
+        from openai import AsyncOpenAI
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        # The async client (and its connection pool) is scoped to this
+        # coroutine's event loop; reusing one across asyncio.run calls
+        # would leave keep-alive connections bound to a closed loop.
+        async with httpx.AsyncClient(
+            http2=True, limits=_POOL_LIMITS, timeout=_POOL_TIMEOUT
+        ) as http:
+            client = AsyncOpenAI(api_key=self._api_key, http_client=http)
+
+            async def _run(path):
+                async with semaphore:
+                    return await self._extract_async(client, path, custom_prompt)
+
+            raw = await asyncio.gather(
+                *(_run(path) for path in image_paths), return_exceptions=True
+            )
+        results = []
+        for path, result in zip(image_paths, raw):
+            if isinstance(result, BaseException):
+                result = {
+                    "success": False,
+                    "error": str(result),
+                    "source_image": str(path),
+                }
+            results.append(result)
+        self.total_cost += sum(
+            r.get("metadata", {}).get("cost", 0.0) for r in results
+        )
+        return results
+
+    def batch_process(
+        self,
+        image_paths: list,
+        custom_prompt: str = None,
+        concurrency: int = 8,
+    ) -> list:
+        """Synchronous wrapper around batch_process_async."""
+        return asyncio.run(
+            self.batch_process_async(image_paths, custom_prompt, concurrency)
+        )
+
+    def _encode_stitched(self, image_paths: list) -> str:
+        """Stack several pages into one tall JPEG data URL.
+
+        Pages are resized to a common width and separated by a thin
+        white band so the model can tell them apart.
+        """
+        images = []
+        for path in image_paths:
+            image = cv2.imread(str(path))
+            if image is None:
+                raise ValueError(f"Could not read image: {path}")
+            images.append(image)
+
+        width = min(min(im.shape[1] for im in images), STITCH_WIDTH)
+        separator = np.full(
+            (STITCH_SEPARATOR_PX, width, 3), 255, dtype=np.uint8
+        )
+        parts = []
+        for i, image in enumerate(images):
+            if i:
+                parts.append(separator)
+            h, w = image.shape[:2]
+            parts.append(
+                cv2.resize(
+                    image, (width, max(1, round(h * width / w))),
+                    interpolation=cv2.INTER_AREA,
+                )
+            )
+        stitched = np.vstack(parts)
+        ok, buf = cv2.imencode(
+            ".jpg", stitched, [cv2.IMWRITE_JPEG_QUALITY, UPLOAD_JPEG_QUALITY]
+        )
+        if not ok:
+            raise ValueError("JPEG encoding failed for stitched batch")
+        return (b"data:image/jpeg;base64," + base64.b64encode(buf)).decode("ascii")
+
+    def extract_batch(
+        self,
+        image_paths: list,
+        custom_prompt: str = None,
+        batch_size: int = 4,
+    ) -> list:
+        """OCR several pages per API call by stitching them vertically.
+
+        Each vision call costs seconds of round-trip regardless of
+        content, so notebook sessions of related pages are stacked into
+        one tall image and transcribed in a single request, cutting
+        round-trips by the batch factor.
+
+        Args:
+            image_paths: Paths to the note images, in page order.
+            custom_prompt: Optional prompt override; must ask for a JSON
+                object with a "pages" list (see BATCH_PROMPT).
+            batch_size: Pages stitched per API call.
+
+        Returns:
+            List of per-page result dicts, in input order.
+        """
+        results = []
+        for start in range(0, len(image_paths), batch_size):
+            chunk = list(image_paths[start:start + batch_size])
+            results.extend(self._extract_stitched_chunk(chunk, custom_prompt))
+        return results
+
+    def _extract_stitched_chunk(self, chunk: list, custom_prompt: str) -> list:
+        """Run one stitched vision call and split the result per page."""
+        def _failures(error):
+            return [
+                {"success": False, "error": error, "source_image": str(path)}
+                for path in chunk
+            ]
+
+        try:
+            data_url = self._encode_stitched(chunk)
+        except Exception as exc:  # noqa: BLE001 - surface per-chunk failures
+            return _failures(str(exc))
+
+        prompt = custom_prompt or BATCH_PROMPT.format(page_count=len(chunk))
+        source = ", ".join(str(path) for path in chunk)
+        combined = self._extract_from_data_url(data_url, prompt, source)
+        self.total_cost += combined.get("metadata", {}).get("cost", 0.0)
+        if not combined.get("success"):
+            return _failures(combined.get("error", "batch call failed"))
+
+        pages = combined.get("pages")
+        if not isinstance(pages, list) or len(pages) != len(chunk):
+            return _failures("batch response did not contain one page per image")
+
+        meta = combined["metadata"]
+        per_page_cost = meta["cost"] / len(chunk)
+        results = []
+        for path, page in zip(chunk, pages):
+            result = dict(page)
+            result["success"] = True
+            result["metadata"] = {
+                "model": meta["model"],
+                "cost": per_page_cost,
+                "source_image": str(path),
+                "batch_pages": len(chunk),
+            }
+            results.append(result)
+        return results
@@ -0,0 +1,222 @@
+"""
+Image preprocessing for the note ingestion pipeline.
+
+Cleans up phone photos / scans of handwritten notes before OCR:
+orientation correction, denoising, and contrast enhancement
+(see TECHNICAL_SPECS.md, "OCR Pipeline").
+"""
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+def _dominant_angle_bin_py(angles_deg: np.ndarray) -> int:
+    """Return the dominant 1-degree bin of Hough line angles.
+
+    Written as a plain counting loop so Numba can compile it; in batch
+    preprocessing this is hot per-image work where the interpreter
+    overhead of the numpy expression shows up.
+    """
+    counts = np.zeros(180, dtype=np.int64)
+    for i in range(angles_deg.shape[0]):
+        b = int(angles_deg[i])
+        if b < 0:
+            b = 0
+        elif b > 179:
+            b = 179
+        counts[b] += 1
+    best = 0
+    for b in range(1, 180):
+        if counts[b] > counts[best]:
+            best = b
+    return best
+
+
+try:
+    from numba import njit
+
+    _dominant_angle_bin = njit(cache=True)(_dominant_angle_bin_py)
+    # Warm-up: trigger compilation at import (a cache hit from the
+    # second run on) so the first image doesn't pay it in the hot path.
+    # Numba specializes per dtype/layout, so this must match the call
+    # site: a contiguous float64 1-d array.
+    _dominant_angle_bin(np.zeros(1, dtype=np.float64))
+except ImportError:  # numba is optional; fall back to vectorized numpy
+    _dominant_angle_bin = None
+
+
+class ImagePreprocessor:
+    """Prepares raw note images for vision OCR."""
+
+    def __init__(self, jpeg_quality: int = 95):
+        self.jpeg_quality = jpeg_quality
+        # Reused across images: createCLAHE allocates a C++ object per
+        # call, and batches of same-sized photos share rotation matrices.
+        self._clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        self._rot_cache = {}
+
+    def detect_orientation(self, image: np.ndarray) -> int:
+        """Estimate the rotation needed to make text lines horizontal.
+
+        Uses a Hough transform over Canny edges and picks the dominant
+        line angle.
+
+        Args:
+            image: BGR image array.
+
+        Returns:
+            Rotation angle in degrees (0 or 90). A Hough-theta vote
+            cannot tell a page from its 180-degree flip, so upside-down
+            pages are not corrected.
+        """
+        # Orientation is a low-frequency property: a ~1000px long edge
+        # gives the same 0/90/180/270 answer as full-resolution input
+        # while making threshold/Canny/Hough 10x+ cheaper.
+        h, w = image.shape[:2]
+        scale = 1000.0 / max(h, w)
+        if scale < 1.0:
+            image = cv2.resize(
+                image, (int(w * scale), int(h * scale)),
+                interpolation=cv2.INTER_AREA,
+            )
+
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        edges = cv2.Canny(thresh, 50, 150, apertureSize=3)
+        lines = cv2.HoughLines(edges, 1, np.pi / 180, threshold=200)
+        if lines is None or lines.shape[0] < 10:
+            # Too few lines for a reliable vote; leave as-is.
+            return 0
+
+        # Contiguous float64 so the array matches the signature the
+        # kernel was warmed up with (HoughLines yields a float32 view).
+        angles = np.degrees(lines[:, 0, 1]).astype(np.float64)
+        if _dominant_angle_bin is not None:
+            dominant = float(_dominant_angle_bin(angles))
+        else:
+            # 1-degree bins over [0, 180); bincount beats np.histogram
+            # for small fixed integer bins.
+            hist = np.bincount(
+                np.clip(angles.astype(np.intp), 0, 179), minlength=180
+            )
+            dominant = float(np.argmax(hist))
+
+        # Hough theta is the line normal: ~90 deg means horizontal text lines.
+        if 80.0 <= dominant <= 100.0:
+            return 0
+        if dominant <= 10.0 or dominant >= 170.0:
+            return 90
+        return 0
+
+    def rotate_image(self, image: np.ndarray, angle: float) -> np.ndarray:
+        """Rotate an image by the given angle (counter-clockwise)."""
+        if angle == 0:
+            return image
+        if angle == 90:
+            return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+        if angle == 180:
+            return cv2.rotate(image, cv2.ROTATE_180)
+        if angle == 270:
+            return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+
+        # Arbitrary-angle fallback (fine deskew).
+        h, w = image.shape[:2]
+        key = (w, h, round(angle, 2))
+        matrix = self._rot_cache.get(key)
+        if matrix is None:
+            center = (w / 2, h / 2)
+            matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+            self._rot_cache[key] = matrix
+        return cv2.warpAffine(
+            image, matrix, (w, h),
+            flags=cv2.INTER_CUBIC,
+            borderMode=cv2.BORDER_REPLICATE,
+        )
+
+    def denoise_and_enhance(self, image: np.ndarray) -> np.ndarray:
+        """Denoise and boost contrast in a single LAB-space pass.
+
+        Running these as separate steps cost five full-image colour
+        conversions; preprocessing is memory-bound at note resolutions,
+        so converting to LAB once, running non-local-means and CLAHE on
+        the L channel, and converting back once roughly halves the
+        pixel-buffer traffic. Ink/paper contrast lives in luminance, so
+        OCR quality is unchanged.
+        """
+        lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+        l_chan, a_chan, b_chan = cv2.split(lab)
+        l_chan = cv2.fastNlMeansDenoising(
+            l_chan, None, h=10, templateWindowSize=7, searchWindowSize=21
+        )
+        l_chan = self._clahe.apply(l_chan)
+        lab = cv2.merge((l_chan, a_chan, b_chan))
+        return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+
+    def _imread_adaptive(self, image_path: Path) -> tuple:
+        """Decode an image, at reduced resolution when it exceeds OCR needs.
+
+        GPT-4o downsamples to ~2048px internally, so denoising a 12MP
+        photo at full size is wasted work. Dimensions come from the
+        header (PIL reads it without decoding pixels); oversized images
+        are decoded with IMREAD_REDUCED_COLOR_2/_4, which the JPEG
+        decoder produces directly, skipping most of the IDCT work.
+
+        Returns:
+            Tuple of (BGR image array or None, decode scale relative to
+            the source file: 1.0, 0.5, or 0.25).
+        """
+        flag, scale = cv2.IMREAD_COLOR, 1.0
+        try:
+            from PIL import Image
+
+            with Image.open(image_path) as im:
+                long_edge = max(im.size)
+            if long_edge > 6000:
+                flag, scale = cv2.IMREAD_REDUCED_COLOR_4, 0.25
+            elif long_edge > 3000:
+                flag, scale = cv2.IMREAD_REDUCED_COLOR_2, 0.5
+        except Exception:  # noqa: BLE001 - fall back to a full decode
+            pass
+        return cv2.imread(str(image_path), flag), scale
+
+    def process_image(self, image_path: Path) -> tuple:
+        """Run the full preprocessing chain on one image file.
+
+        Args:
+            image_path: Path to a JPEG/PNG note image.
+
+        Returns:
+            Tuple of (preprocessed BGR image array, decode scale
+            relative to the source file — 1.0 for a full decode, 0.5 or
+            0.25 for a reduced one), so consumers can record how much
+            resolution the pipeline actually saw.
+
+        Raises:
+            ValueError: If the image cannot be read.
+        """
+        image, decoded_scale = self._imread_adaptive(image_path)
+        if image is None:
+            raise ValueError(f"Could not read image: {image_path}")
+
+        angle = self.detect_orientation(image)
+        image = self.rotate_image(image, angle)
+        image = self.denoise_and_enhance(image)
+        return image, decoded_scale
+
+    def save_processed_image(self, image: np.ndarray, output_path: Path) -> Path:
+        """Write a processed image to disk as JPEG.
+
+        Encodes in memory and writes the buffer in one call; callers
+        are expected to have created the parent directory (cv2.imwrite's
+        open/write/close plus a per-image mkdir adds up under batch
+        concurrency).
+        """
+        ok, buf = cv2.imencode(
+            ".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        )
+        if not ok:
+            raise ValueError(f"JPEG encoding failed for: {output_path}")
+        output_path.write_bytes(buf.tobytes())
+        return output_path